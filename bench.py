@@ -0,0 +1,273 @@
+import gc
+import os
+import subprocess
+import sys
+import tracemalloc
+from random import Random, choice, seed
+from statistics import median
+from time import perf_counter
+
+import logic
+from logic import ROWS, COLS, DEPTH, minimax_pruning, is_finished, SearchContext, State
+
+GAMES = 3
+SEED = 0
+# runs of each search internals, alternated so that machine noise affects both alike
+REPEATS = 3
+
+
+def main():
+    _startup()
+    print()
+    _nodes()
+    print()
+    _memory()
+
+
+def _startup():
+    """
+    Time cold starts in fresh processes: importing the console game along with the engine,
+    and setting up the pygame UI's font the old way with SysFont and the new way, before and after its file is remembered
+    """
+    print(f"Importing the console game: {_cold('import console') * 1000:.0f} ms")
+
+    try:
+        import graphics
+    except ImportError:
+        print("pygame is not installed, so the pygame UI's startup is not measured")
+        return
+
+    setup = "import graphics, pygame as pg; pg.display.init(); pg.font.init()"
+    sysfont = _cold("pg.font.SysFont(graphics.FONT, 40)", setup)
+    if os.path.exists(graphics.FONT_PATH_FILE):
+        os.remove(graphics.FONT_PATH_FILE)
+    first = _cold("graphics._font(40)", setup)
+    later = _cold("graphics._font(40)", setup)
+
+    print(f"Setting up the font with SysFont: {sysfont * 1000:.1f} ms")
+    print(f"Setting up the font on the first start: {first * 1000:.1f} ms")
+    print(f"Setting up the font on later starts: {later * 1000:.1f} ms")
+
+
+def _cold(code: str, setup: str = "") -> float:
+    """Returns the seconds a fresh Python process takes to run code, after running setup"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-W",
+            "ignore",
+            "-c",
+            f"{setup}\nfrom time import perf_counter\nbefore = perf_counter()\n{code}\nprint(perf_counter() - before)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1"),
+    )
+    return float(result.stdout.split()[-1])
+
+
+def _nodes():
+    """
+    Play a few bot vs bot games, and compare the nodes searched for each of the bot's moves
+    by a cold search and by a search that carries a SearchContext from move to move
+    """
+    cold_total = warm_total = 0
+    for game in range(GAMES):
+        print(f"--- GAME {game + 1} ---")
+        print(f"{'move':>4} {'cold':>8} {'warm':>8} {'saved':>7}")
+
+        cold, warm = _play(SEED + game)
+        for move, (cold_nodes, (warm_nodes, researched)) in enumerate(zip(cold, warm), 1):
+            print(
+                f"{move:>4} {cold_nodes:>8} {warm_nodes:>8} {1 - warm_nodes / cold_nodes:>7.1%}"
+                + (" (re-searched)" if researched else "")
+            )
+        cold_total += sum(cold)
+        warm_total += sum(nodes for nodes, _ in warm)
+        print()
+
+    print(f"Total: {cold_total} cold, {warm_total} warm, {1 - warm_total / cold_total:.1%} saved")
+
+
+def _memory():
+    """
+    Search the opening position with the current search internals, and with the dict-based ones they replaced,
+    and compare their time, garbage collections and peak memory
+
+    CPython has no allocation counter, but garbage collections are triggered by allocating container objects,
+    so collections per thousand nodes stand in for the allocations made per node
+    """
+    state: list[list[State]] = [
+        [State.UNFINISHED for _ in range(COLS)] for _ in range(ROWS)
+    ]
+    internals = {"dicts": _dict_options, "tuples": logic._best_options}
+    times: dict[str, list[float]] = {name: [] for name in internals}
+    collections: dict[str, list[int]] = {name: [] for name in internals}
+
+    for _ in range(REPEATS):
+        for name, search in internals.items():
+            context = SearchContext()
+            spent, collected = _measure(search, state, context)
+            times[name].append(spent / context.nodes)
+            collections[name].append(collected)
+
+    print(f"Opening search at depth {DEPTH}: {context.nodes} nodes, median of {REPEATS} runs")
+    print(f"{'':>6} {'us/node':>8} {'GCs/1000 nodes':>15} {'peak KiB':>9}")
+    for name, search in internals.items():
+        # traced separately, as tracing slows the search down
+        tracemalloc.start()
+        search(state, DEPTH, State.RED, float("-inf"), float("inf"), SearchContext())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(
+            f"{name:>6} {median(times[name]) * 1e6:>8.1f} "
+            f"{median(collections[name]) / context.nodes * 1000:>15.2f} {peak / 1024:>9.1f}"
+        )
+
+    # most of a node's time goes into the heuristic at the leaves, which both internals share
+    heuristic = logic._estimate_heuristic
+    heuristic_time = 0.0
+
+    def timed_heuristic(state: list[list[State]]) -> float:
+        nonlocal heuristic_time
+        before = perf_counter()
+        score = heuristic(state)
+        heuristic_time += perf_counter() - before
+        return score
+
+    logic._estimate_heuristic = timed_heuristic
+    try:
+        spent, _ = _measure(logic._best_options, state, SearchContext())
+    finally:
+        logic._estimate_heuristic = heuristic
+    print(f"{heuristic_time / spent:.0%} of the search is spent in _estimate_heuristic")
+
+
+def _measure(search, state: list[list[State]], context: SearchContext) -> tuple[float, int]:
+    """Returns the time a full-window search of the opening took, and the garbage collections during it"""
+    collections = 0
+
+    def count_collection(phase: str, _):
+        nonlocal collections
+        if phase == "start":
+            collections += 1
+
+    gc.collect()
+    gc.callbacks.append(count_collection)
+    before = perf_counter()
+    search(state, DEPTH, State.RED, float("-inf"), float("inf"), context)
+    spent = perf_counter() - before
+    gc.callbacks.remove(count_collection)
+    return spent, collections
+
+
+def _dict_options(
+    state: list[list[State]],
+    depth: int,
+    turn: State,
+    alpha: float,
+    beta: float,
+    context: SearchContext,
+) -> list[dict]:
+    """
+    The search internals from before logic._best_options used compact records, kept to compare against:
+    a dict for every child, and several passes over the list of options to pick the best ones
+    """
+    context.nodes += 1
+
+    if depth == 0:
+        return [{"score": logic._estimate_heuristic(state), "depth": 0}]
+
+    options: list[dict[str, tuple[int, int] | float | int]] = []
+
+    possible_moves = logic._get_possible_moves(state)
+    possible_moves.sort(
+        key=lambda move: abs(move[0] - ROWS / 2) + abs(move[1] - COLS / 2)
+    )
+
+    for row, col in possible_moves:
+        state[row][col] = turn
+        finished = is_finished(state, (row, col))
+
+        if finished:
+            option = {
+                "move": (row, col),
+                "score": 0 if finished == State.TIED else finished.value * float("inf"),
+                "depth": depth - 1,
+                "pv": ((row, col),),
+            }
+        else:
+            option = choice(_dict_options(state, depth - 1, -turn, alpha, beta, context))
+            option["move"] = row, col
+            option["pv"] = ((row, col),) + option.get("pv", ())
+
+        state[row][col] = State.UNFINISHED
+        options.append(option)
+
+        if turn == State.RED:
+            alpha = max(alpha, option["score"])
+        else:
+            beta = min(beta, option["score"])
+        if beta < alpha:
+            break
+
+    best_score_func = max if turn == State.RED else min
+    best_score = best_score_func(map(lambda option: option["score"], options))
+
+    if best_score == (-turn).value * float("inf"):
+        best_depth = min(map(lambda option: option["depth"], options))
+        options = list(
+            filter(lambda option: option["depth"] == best_depth, options)
+        )
+    else:
+        best_options_by_score = tuple(
+            filter(lambda option: option["score"] == best_score, options)
+        )
+        best_depth = max(
+            map(lambda option: option["depth"], best_options_by_score)
+        )
+        options = list(
+            filter(
+                lambda option: option["depth"] == best_depth,
+                best_options_by_score
+            )
+        )
+
+    return options
+
+
+def _play(game_seed: int) -> tuple[list[int], list[tuple[int, bool]]]:
+    """
+    Play Red with the searched bot against a shallower Yellow bot
+
+    Returns the nodes of each cold search, and the SearchContext's history
+    """
+    seed(game_seed)
+    rng = Random(game_seed)
+    state: list[list[State]] = [
+        [State.UNFINISHED for _ in range(COLS)] for _ in range(ROWS)
+    ]
+    context = SearchContext()
+    cold: list[int] = []
+    turn = State.RED
+
+    while True:
+        if turn == State.RED:
+            cold_context = SearchContext()
+            cold_context.search(state, DEPTH, turn)
+            cold.append(cold_context.nodes)
+            row, col = context.search(state, DEPTH, turn)["move"]
+        else:
+            row, col = minimax_pruning(state, rng.choice((1, 2)), turn)["move"]
+
+        state[row][col] = turn
+        if is_finished(state, (row, col)):
+            return cold, context.history
+        turn = -turn
+
+
+if __name__ == "__main__":
+    main()
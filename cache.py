@@ -0,0 +1,165 @@
+import sqlite3
+from hashlib import blake2b
+from time import time
+
+import logic
+from logic import State
+
+# how often (in seconds) a cache hit is allowed to refresh the entry's timestamp
+TOUCH_INTERVAL = 60
+# how many entries are evicted at once when the store is full, so that eviction doesn't happen on every write
+EVICT_EVERY = 100
+
+
+class EvaluationCache:
+    """
+    On-disk store of minimax_pruning results, shared by every process that opens the same file
+
+    Entries are keyed by the board configuration, the search depth and a hash of the canonical position,
+    where the canonical position is the smaller of the board and its mirror image, together with the side to move.
+    The database runs in WAL mode, so any number of processes can read while one of them writes.
+
+    The store never holds more than max_entries positions: a write that would go over it first evicts
+    the EVICT_EVERY least recently used ones. The number of entries is kept up to date by triggers in a one-row table,
+    so neither opening the store nor writing to it has to count the entries
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+        self._db.execute("BEGIN IMMEDIATE")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS positions ("
+            " config TEXT NOT NULL,"
+            " hash INTEGER NOT NULL,"
+            " depth INTEGER NOT NULL,"
+            " score REAL NOT NULL,"
+            " result_depth INTEGER NOT NULL,"
+            " moves BLOB NOT NULL,"
+            " stamp REAL NOT NULL,"
+            " PRIMARY KEY (config, hash, depth)"
+            ")"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS positions_stamp ON positions (stamp)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (count INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS positions_insert AFTER INSERT ON positions"
+            " BEGIN UPDATE entries SET count = count + 1; END"
+        )
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS positions_delete AFTER DELETE ON positions"
+            " BEGIN UPDATE entries SET count = count - 1; END"
+        )
+        # only counted once, when the count is first set up
+        if self._db.execute("SELECT count FROM entries").fetchone() is None:
+            self._db.execute("INSERT INTO entries SELECT COUNT(*) FROM positions")
+        self._db.execute("COMMIT")
+
+    def get(
+        self, state: list[list[State]], depth: int, turn: State
+    ) -> tuple[float, int, list[tuple[int, int]]] | None:
+        """
+        Look up a position searched to the given depth
+
+        Returns the score, the depth of the result and the list of equally best moves, or None if the position isn't stored
+        """
+        key, mirrored = _canonical_hash(state, turn)
+        config = _config()
+        row = self._db.execute(
+            "SELECT score, result_depth, moves, stamp FROM positions WHERE config = ? AND hash = ? AND depth = ?",
+            (config, key, depth),
+        ).fetchone()
+        if row is None:
+            return None
+
+        score, result_depth, moves, stamp = row
+
+        # refresh the entry so it is not evicted, but not on every hit, as every refresh is a write
+        now = time()
+        if now - stamp > TOUCH_INTERVAL:
+            self._db.execute(
+                "UPDATE positions SET stamp = ? WHERE config = ? AND hash = ? AND depth = ?",
+                (now, config, key, depth),
+            )
+
+        return score, result_depth, _unpack_moves(moves, mirrored)
+
+    def put(
+        self,
+        state: list[list[State]],
+        depth: int,
+        turn: State,
+        score: float,
+        result_depth: int,
+        moves: list[tuple[int, int]],
+    ):
+        """Store the result of searching a position to the given depth"""
+        key, mirrored = _canonical_hash(state, turn)
+
+        # the write and the eviction it may need happen together, so that processes sharing the file can't both evict
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (config, hash, depth) DO UPDATE SET"
+                " score = excluded.score, result_depth = excluded.result_depth,"
+                " moves = excluded.moves, stamp = excluded.stamp",
+                (_config(), key, depth, score, result_depth, _pack_moves(moves, mirrored), time()),
+            )
+            self._evict()
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT count FROM entries").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM positions WHERE rowid IN (SELECT rowid FROM positions ORDER BY stamp LIMIT ?)",
+                (count - self.max_entries + min(EVICT_EVERY, self.max_entries),),
+            )
+
+
+def _config() -> str:
+    # read at call time, so the key follows the configuration the engine is actually using
+    return f"{logic.ROWS}x{logic.COLS}:{logic.CONNECT}"
+
+
+def _canonical_hash(state: list[list[State]], turn: State) -> tuple[int, bool]:
+    """
+    Hash the canonical form of a position
+
+    Returns the hash, and whether the canonical form is the mirror image of the given board
+    """
+    board = bytes(cell.value + 1 for row in state for cell in row)
+    mirror = bytes(cell.value + 1 for row in state for cell in reversed(row))
+    mirrored = mirror < board
+
+    digest = blake2b(min(board, mirror) + bytes((turn.value + 1,)), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True), mirrored
+
+
+def _pack_moves(moves: list[tuple[int, int]], mirrored: bool) -> bytes:
+    return bytes(
+        x for row, col in moves for x in (row, logic.COLS - 1 - col if mirrored else col)
+    )
+
+
+def _unpack_moves(packed: bytes, mirrored: bool) -> list[tuple[int, int]]:
+    return [
+        (packed[i], logic.COLS - 1 - packed[i + 1] if mirrored else packed[i + 1])
+        for i in range(0, len(packed), 2)
+    ]
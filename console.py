@@ -1,6 +1,6 @@
 from time import sleep, perf_counter
 
-from logic import ROWS, COLS, CONNECT, DEPTH, minimax_pruning, is_finished, ConfigError, State
+from logic import ROWS, COLS, CONNECT, DEPTH, CACHE_FILE, is_finished, open_cache, SearchContext, ConfigError, State
 
 
 def play():
@@ -14,6 +14,8 @@ def play():
     elif CONNECT > ROWS and CONNECT > COLS:
         raise ConfigError("CONNECT is longer than both ROWS and COLS")
 
+    cache = open_cache(CACHE_FILE)
+
     while True:
         try:
             player = _get_player_turn()
@@ -23,6 +25,7 @@ def play():
             print()
 
             turn = State.RED
+            context = SearchContext()
             state: list[list[State]] = [
                 [State.UNFINISHED for _ in range(COLS)] for _ in range(ROWS)
             ]
@@ -33,7 +36,7 @@ def play():
                     state[row][col] = turn
                 else:
                     before = perf_counter()
-                    option = minimax_pruning(state, DEPTH, turn)
+                    option = context.search(state, DEPTH, turn, cache)
                     row, col = option["move"]
                     state[row][col] = turn
                     spent = perf_counter() - before
@@ -57,6 +60,9 @@ def play():
         except KeyboardInterrupt:
             break
 
+    if cache is not None:
+        cache.close()
+
 
 def _get_player_turn() -> State:
     while True:
@@ -1,8 +1,11 @@
+import os
+from functools import lru_cache
+from tempfile import gettempdir
 from time import perf_counter, sleep
 
 import pygame as pg
 
-from logic import ROWS, COLS, CONNECT, DEPTH, minimax_pruning, is_finished, ConfigError, State
+from logic import ROWS, COLS, CONNECT, DEPTH, CACHE_FILE, is_finished, open_cache, SearchContext, ConfigError, State
 
 FPS = 30
 WHITE = (170, 170, 170)
@@ -11,6 +14,9 @@ RED = (173, 19, 19)
 YELLOW = (174, 174, 0)
 ASPECT_RATIO = (4, 3)
 FONT = "Candara"
+# where the file FONT was found in is remembered, as finding it scans every font on the system.
+# Delete it to look for the font again, e.g. after installing it
+FONT_PATH_FILE = os.path.join(gettempdir(), "connect_x_font_path")
 
 
 def main():
@@ -24,8 +30,11 @@ def main():
     elif CONNECT > ROWS and CONNECT > COLS:
         raise ConfigError("CONNECT is longer than both ROWS and COLS")
 
-    # Initialize pygame stuff
-    pg.init()
+    cache = open_cache(CACHE_FILE)
+
+    # Initialize pygame stuff, only the modules that are used rather than everything pg.init() brings up
+    pg.display.init()
+    pg.font.init()
     window_width = pg.display.Info().current_w * 3 // 5
     window_height = window_width * ASPECT_RATIO[1] // ASPECT_RATIO[0]
     window = pg.display.set_mode((window_width, window_height))
@@ -50,7 +59,7 @@ def main():
     while window_active:
         if menu_active:
             # Background
-            font = pg.font.SysFont(FONT, menu_font_size)
+            font = _font(menu_font_size)
             bground.fill(WHITE)
 
             # Prompt for going first
@@ -133,6 +142,7 @@ def main():
             turn = State.RED
             choice = 0
             finished = State.UNFINISHED
+            context = SearchContext()
             state: list[list[State]] = [
                 [State.UNFINISHED for _ in range(COLS)] for _ in range(ROWS)
             ]
@@ -172,7 +182,7 @@ def main():
             bground.fill(WHITE)
             bground.blit(board, board_rect)
 
-            font = pg.font.SysFont(FONT, int(menu_font_size / 1.8))
+            font = _font(int(menu_font_size / 1.8))
             # draw initial cursor position
             cursor = font.render("^", True, BLACK)
             cursor_rect = cursor.get_rect(
@@ -224,7 +234,7 @@ def main():
 
                     rematch_prompt = _wrapped_text(
                         "Press Esc to quit, or any key to rematch",
-                        pg.font.SysFont(FONT, int(menu_font_size / 2.2)),
+                        _font(int(menu_font_size / 2.2)),
                         WHITE,
                         BLACK,
                         bground.get_width()
@@ -266,7 +276,7 @@ def main():
                 if turn != player:
                     # Update game state
                     before = perf_counter()
-                    row, col = minimax_pruning(state, DEPTH, turn)["move"]
+                    row, col = context.search(state, DEPTH, turn, cache)["move"]
                     state[row][col] = turn
                     turn = player
 
@@ -360,9 +370,43 @@ def main():
                 window.blit(bground, bground_rect)
                 pg.display.update()
 
+    if cache is not None:
+        cache.close()
+    _font.cache_clear()
     pg.quit()
 
 
+@lru_cache(maxsize=None)
+def _font(size: int) -> pg.font.Font:
+    """Returns the game font in the given size, built only once per size"""
+    return pg.font.Font(_font_path(), size)
+
+
+@lru_cache(maxsize=None)
+def _font_path() -> str | None:
+    """
+    Returns the file of FONT, or None for pygame's default font if FONT isn't installed
+
+    Finding the file makes pygame scan every font on the system on the first start,
+    after which it is read from FONT_PATH_FILE
+    """
+    try:
+        with open(FONT_PATH_FILE) as file:
+            font, path = file.read().split("\n")
+        if font == FONT and (not path or os.path.isfile(path)):
+            return path or None
+    except (OSError, ValueError):
+        pass
+
+    path = pg.font.match_font(FONT)
+    try:
+        with open(FONT_PATH_FILE, "w") as file:
+            file.write(f"{FONT}\n{path or ''}")
+    except OSError:
+        pass
+    return path
+
+
 def _wrapped_text(
     text: str,
     font: pg.font.Font,
@@ -1,11 +1,19 @@
 from enum import Enum
 from random import choice
+from time import perf_counter
 
 # m, n, k generalized game
 ROWS = 8
 COLS = 8
 CONNECT = 4
 DEPTH = 4
+# path of the on-disk evaluation cache shared between games, or None to disable it
+CACHE_FILE = None
+# half-width of the aspiration window centered on the previous move's score
+ASPIRATION_WINDOW = 1.0
+
+# the principal variations of a leaf, which has no moves left to choose from
+_NO_VARIATION = (None,)
 
 
 class State(Enum):
@@ -32,47 +40,57 @@ class ConfigError(Exception):
     pass
 
 
-def is_finished(state: list[list[State]], last_move: tuple[int, int]) -> State:
+class SearchTimeout(Exception):
+    """Raised inside a search once its SearchContext's deadline has passed"""
+
+
+def is_finished(state: list[list[State]], last_move: tuple[int, int], connect: int | None = None) -> State:
     """
     Check if game is finished
     Since a game can only end after a move, and a player can only win from the last move made, checking the entire board
     is not needed, instead checking only lines made with the last move is necessary
 
+    The size of the board is taken from the state, and the length of a winning line is CONNECT unless connect is given
+
     Returns the corresponding State enum for the game state
     """
+    rows, cols = len(state), len(state[0])
+    if connect is None:
+        connect = CONNECT
+
     def n_s():
         return (
-            row in range(ROWS - CONNECT + 1)
-            and len(set(state[row + i][col] for i in range(CONNECT))) == 1
+            row in range(rows - connect + 1)
+            and len(set(state[row + i][col] for i in range(connect))) == 1
         )
 
     def w_e():
         return any(
             (
-                col + i in range(COLS - CONNECT + 1)
-                and len(set(state[row][col + i:col + i + CONNECT])) == 1
+                col + i in range(cols - connect + 1)
+                and len(set(state[row][col + i:col + i + connect])) == 1
             )
-            for i in range(0, -CONNECT, -1)
+            for i in range(0, -connect, -1)
         )
 
     def nw_se():
         return any(
             (
-                row + i in range(ROWS - CONNECT + 1)
-                and col + i in range(COLS - CONNECT + 1)
-                and len(set(state[row + j][col + j] for j in range(i, i + CONNECT))) == 1
+                row + i in range(rows - connect + 1)
+                and col + i in range(cols - connect + 1)
+                and len(set(state[row + j][col + j] for j in range(i, i + connect))) == 1
             )
-            for i in range(0, -CONNECT, -1)
+            for i in range(0, -connect, -1)
         )
 
     def sw_ne():
         return any(
             (
-                row - i in range(CONNECT, ROWS)
-                and col + i in range(COLS - CONNECT + 1)
-                and len(set(state[row - j][col + j] for j in range(i, i + CONNECT))) == 1
+                row - i in range(connect, rows)
+                and col + i in range(cols - connect + 1)
+                and len(set(state[row - j][col + j] for j in range(i, i + connect))) == 1
             )
-            for i in range(0, -CONNECT, -1)
+            for i in range(0, -connect, -1)
         )
 
     row, col = last_move
@@ -94,96 +112,269 @@ def minimax_pruning(
     turn: State,
     alpha: float = float("-inf"),
     beta: float = float("inf"),
+    cache=None,
+    context: "SearchContext | None" = None,
 ) -> dict:
+    """
+    Depth-limited minimax with naive alpha-beta pruning, see _best_options
+
+    Returns one of the best options, chosen randomly, along with its principal variation ("pv"),
+    the line of moves expected to follow from it
+
+    If an EvaluationCache is given, the position is looked up in it before searching,
+    and the result is stored in it afterwards if it is exact: either strictly inside the alpha-beta window,
+    or searched with a full window
+
+    If a SearchContext is given, it counts the nodes searched and its principal variation is tried first
+    """
+    if cache is not None and depth > 0:
+        cached = cache.get(state, depth, turn)
+        if cached is not None:
+            score, option_depth, moves = cached
+            return {"move": choice(moves), "score": score, "depth": option_depth}
+
+    score, option_depth, pvs = _best_options(state, depth, turn, alpha, beta, context)
+
+    exact = alpha < score < beta or (alpha == float("-inf") and beta == float("inf"))
+    if cache is not None and depth > 0 and exact:
+        cache.put(state, depth, turn, score, option_depth, [pv[0] for pv in pvs])
+
+    pv = choice(pvs)
+    if pv is None:
+        return {"score": score, "depth": option_depth}
+    return {"move": pv[0], "score": score, "depth": option_depth, "pv": _unwind(pv)}
+
+
+def _best_options(
+    state: list[list[State]],
+    depth: int,
+    turn: State,
+    alpha: float,
+    beta: float,
+    context: "SearchContext | None" = None,
+) -> tuple[float, int, list | tuple]:
     """
     Depth-limited minimax with naive alpha-beta pruning
 
-    All possible moves are added to a list along with their estimated/determined score.
+    Every possible move is scored, while keeping track of the best score, its depth and all the options tied for it.
 
-    Afterwards, all the non-best options in the list are eliminated,
-    then a move is chosen randomly among the ones remaining
+    Returns the best score, its depth and the principal variations of the tied options,
+    so that a move can be chosen randomly among them
 
     This ensures that when given a state that is commonly seen with multiple options that has the same score,
     e.g. the opening state, the bot doesn't make the same option every time
+
+    Principal variations are linked pairs of (move, rest of the variation), ending with None,
+    so that extending one by a move doesn't copy it
     """
+    if context is not None:
+        context.nodes += 1
+        if context.deadline is not None and perf_counter() > context.deadline:
+            raise SearchTimeout
+
     # return heuristic of state if it is the final depth
     if depth == 0:
-        return {"score": _estimate_heuristic(state), "depth": 0}
-
-    # save all possible options in a list
-    options: list[dict[str, tuple[int, int] | float | int]] = []
+        return _estimate_heuristic(state), 0, _NO_VARIATION
 
     # get list of possible moves, then sort by manhattan distance from center
     possible_moves = _get_possible_moves(state)
-    possible_moves.sort(
-        key=lambda move: abs(move[0] - ROWS / 2) + abs(move[1] - COLS / 2)
-    )
+    possible_moves.sort(key=_distance_from_center)
+
+    # the previous search's move at this ply is likely still good, so it is tried first
+    if context is not None:
+        ply = context.root_depth - depth
+        if 0 <= ply < len(context.pv) and context.pv[ply] in possible_moves:
+            possible_moves.remove(context.pv[ply])
+            possible_moves.insert(0, context.pv[ply])
+
+    maximizing = turn == State.RED
+    losing_score = (-turn).value * float("inf")
+    best_score = best_depth = None
+    ties: list[tuple] = []
 
     # check each possible move
-    for row, col in possible_moves:
+    for move in possible_moves:
+        row, col = move
+
         # assume child state, then check if child state is a finished state
         state[row][col] = turn
-        finished = is_finished(state, (row, col))
+        finished = is_finished(state, move)
 
         # if child state is finished state,
         # child state score is +infinity, or -infinity, depending on if winner is the maximizing player or not, respectively,
         # or 0 if child state is a draw
         if finished:
-            option = {
-                "move": (row, col),
-                "score": 0 if finished == State.TIED else finished.value * float("inf"),
-                "depth": depth - 1,
-            }
+            score = 0 if finished == State.TIED else finished.value * float("inf")
+            option_depth = depth - 1
+            pv = move, None
 
         # if child state is not a finished state, recur
         else:
-            option = minimax_pruning(state, depth - 1, -turn, alpha, beta)
-            option["move"] = row, col
+            try:
+                score, option_depth, child_pvs = _best_options(state, depth - 1, -turn, alpha, beta, context)
+            except SearchTimeout:
+                state[row][col] = State.UNFINISHED
+                raise
+            pv = move, choice(child_pvs)
 
         # return to parent state, ready for next child state
         state[row][col] = State.UNFINISHED
 
-        # add this move and its score to list of options
-        options.append(option)
+        # keep only the options tied for the best score (minimizing or maximizing) for the current player
+        if best_score is None or (score > best_score if maximizing else score < best_score):
+            best_score, best_depth = score, option_depth
+            ties.clear()
+            ties.append(pv)
+        elif score == best_score:
+            if option_depth == best_depth:
+                ties.append(pv)
+            # if the score is a guaranteed loss, only choose among the longest paths (lowest depth),
+            # otherwise choose among the shortest paths (highest depth) to the score
+            elif (option_depth < best_depth) == (score == losing_score):
+                best_depth = option_depth
+                ties.clear()
+                ties.append(pv)
 
         # update alpha or beta depending on if it's the maximizing player's turn or not
         # alpha: maximizing player's lower bound
         # beta:  minimizing player's upper bound
-        if turn == State.RED:
-            alpha = max(alpha, option["score"])
-        else:
-            beta = min(beta, option["score"])
+        if maximizing:
+            if score > alpha:
+                alpha = score
+        elif score < beta:
+            beta = score
         if beta < alpha:
             break
 
-    # Pick out the best score (minimizing or maximizing) for the current player
-    best_score_func = max if turn == State.RED else min
-    best_score = best_score_func(map(lambda option: option["score"], options))
+    return best_score, best_depth, ties
 
-    # if best score possible is a guaranteed loss, only choose among the longest paths (lowest depth)
-    if best_score == (-turn).value * float("inf"):
-        best_depth = min(map(lambda option: option["depth"], options))
-        options = list(
-            filter(lambda option: option["depth"] == best_depth, options)
-        )
 
-    # if best score possible is winnable, choose among the shortest paths (highest depth) to the best possible score
-    else:
-        best_options_by_score = tuple(
-            filter(lambda option: option["score"] == best_score, options)
-        )
-        best_depth = max(
-            map(lambda option: option["depth"], best_options_by_score)
-        )
-        options = list(
-            filter(
-                lambda option: option["depth"] == best_depth,
-                best_options_by_score
-            )
-        )
+def open_cache(path: str | None):
+    """
+    Returns an EvaluationCache stored in the given file, or None if there is no file
 
-    # select a random move from the remaining options and return
-    return choice(options)
+    The cache module, and sqlite with it, is only imported here, so that nothing pays for it unless the cache is used
+    """
+    if path is None:
+        return None
+
+    from cache import EvaluationCache
+    return EvaluationCache(path)
+
+
+class SearchContext:
+    """
+    Memory of the bot's previous search in a game, kept from one bot move to the next
+
+    Consecutive positions in a game are closely related, so the next search is done inside a narrow aspiration window
+    centered on the previous best score, and is only searched again with a full window if the result falls outside of it.
+    The previous principal variation is also tried first at each ply, so branches are pruned sooner
+
+    nodes counts every node searched with this context, and history holds the nodes searched for each move,
+    along with whether that move needed a re-search. depth is the depth the last move was searched to
+
+    While deadline (a perf_counter() time) is set, searching past it raises SearchTimeout
+    """
+
+    def __init__(self, window: float = ASPIRATION_WINDOW):
+        self.window = window
+        self.score: float | None = None
+        self.pv: tuple[tuple[int, int], ...] = ()
+        self.root_depth = 0
+        self.depth = 0
+        self.deadline: float | None = None
+        self.nodes = 0
+        self.history: list[tuple[int, bool]] = []
+
+    def search(
+        self,
+        state: list[list[State]],
+        depth: int,
+        turn: State,
+        cache=None,
+        time_limit: float | None = None,
+    ) -> dict:
+        """
+        Search for the bot's next move, the same way minimax_pruning does
+
+        Given a time limit in seconds, the position is searched one ply deeper at a time up to depth,
+        and the deepest search that finished in time is used. The first ply is always searched
+        """
+        self._follow_pv(state, turn)
+        nodes_before = self.nodes
+
+        if time_limit is None:
+            option, researched = self._search_depth(state, depth, turn, cache)
+            self.depth = depth
+        else:
+            option, researched = self._search_depth(state, 1, turn, cache)
+            self.depth = 1
+            self.deadline = perf_counter() + time_limit
+            try:
+                for iteration_depth in range(2, depth + 1):
+                    option, iteration_researched = self._search_depth(state, iteration_depth, turn, cache)
+                    researched = researched or iteration_researched
+                    self.depth = iteration_depth
+            except SearchTimeout:
+                pass
+            finally:
+                self.deadline = None
+
+        self.history.append((self.nodes - nodes_before, researched))
+        return option
+
+    def _search_depth(self, state: list[list[State]], depth: int, turn: State, cache) -> tuple[dict, bool]:
+        """
+        Search to a fixed depth inside the aspiration window, and remember the result for the next search
+
+        Returns the option found, and whether a re-search was needed
+        """
+        self.root_depth = depth
+        alpha, beta = float("-inf"), float("inf")
+        researched = False
+
+        # a forced win or loss gives no useful window to search around
+        if self.score is not None and abs(self.score) != float("inf"):
+            alpha, beta = self.score - self.window, self.score + self.window
+        option = minimax_pruning(state, depth, turn, alpha, beta, cache, self)
+
+        # fail-low or fail-high: the score is only a bound, so search again with the failed side of the window opened
+        if not alpha < option["score"] < beta:
+            if option["score"] <= alpha and alpha != float("-inf"):
+                researched = True
+                option = minimax_pruning(state, depth, turn, float("-inf"), beta, cache, self)
+            elif option["score"] >= beta and beta != float("inf"):
+                researched = True
+                option = minimax_pruning(state, depth, turn, alpha, float("inf"), cache, self)
+
+        self.score = option["score"]
+        self.pv = option.get("pv", (option["move"],))
+        return option, researched
+
+    def _follow_pv(self, state: list[list[State]], turn: State):
+        """
+        Drop the bot's move and the opponent's reply from the front of the previous principal variation,
+        or forget it entirely if the game did not go as expected
+        """
+        if len(self.pv) > 2:
+            (own_row, own_col), (reply_row, reply_col) = self.pv[:2]
+            if state[own_row][own_col] == turn and state[reply_row][reply_col] == -turn:
+                self.pv = self.pv[2:]
+                return
+        self.pv = ()
+
+
+def _unwind(pv: tuple | None) -> tuple[tuple[int, int], ...]:
+    """Returns the moves of a linked principal variation as a flat tuple"""
+    moves = []
+    while pv is not None:
+        move, pv = pv
+        moves.append(move)
+    return tuple(moves)
+
+
+def _distance_from_center(move: tuple[int, int]) -> float:
+    return abs(move[0] - ROWS / 2) + abs(move[1] - COLS / 2)
 
 
 def _get_possible_moves(state: list[list[State]]) -> list[tuple[int, int]]:
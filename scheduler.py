@@ -0,0 +1,388 @@
+import asyncio
+import os
+from collections import deque
+from collections.abc import AsyncIterable, Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+from random import Random
+from statistics import quantiles
+from time import perf_counter
+
+import logic
+from logic import ROWS, COLS, CONNECT, DEPTH, CACHE_FILE, is_finished, open_cache, ConfigError, SearchContext, State
+
+# seconds of search a bot move is allowed to take. Too small a budget cuts searches short of their depth,
+# e.g. a depth 4 search of an empty 8x8 board takes several seconds, which metrics() shows as cut_short
+MOVE_BUDGET = 2.0
+# how many times a search is tried again after its worker process died
+RETRIES = 1
+# how many of the latest measurements are kept for the metrics
+SAMPLES = 10_000
+
+# load test run by `python scheduler.py`
+SESSIONS = 100
+SESSION_DEPTH = 2
+
+# the evaluation cache of a worker process, opened by _init_worker
+_cache = None
+
+
+class SearchError(Exception):
+    """Raised for a game in which the bot's search failed, and which therefore cannot go on"""
+
+
+class GameEnded(Exception):
+    """Raised to whoever waits for the bot's move in a game that was ended before the bot replied"""
+
+
+class Game:
+    """
+    A game hosted by a Scheduler, with its own configuration and position
+
+    The bot searches one ply deeper at a time, up to depth, until move_budget seconds of search have passed,
+    and plays the deepest search that finished. Time spent waiting for a worker doesn't count against the budget
+
+    If the bot's search fails, error holds the SearchError, and the game cannot be played any further
+    """
+
+    def __init__(
+        self,
+        game_id: int,
+        rows: int = ROWS,
+        cols: int = COLS,
+        connect: int = CONNECT,
+        depth: int = DEPTH,
+        player: State = State.RED,
+        move_budget: float = MOVE_BUDGET,
+    ):
+        # Check for invalid configurations
+        if any(not isinstance(t, int) for t in (rows, cols, connect, depth)):
+            raise TypeError("Configuration constants have incorrect types")
+
+        elif any(v < 1 for v in (rows, cols, connect, depth)):
+            raise ValueError("Configuration constants have incorrect values")
+
+        elif connect > rows and connect > cols:
+            raise ConfigError("CONNECT is longer than both ROWS and COLS")
+
+        self.id = game_id
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.depth = depth
+        self.player = player
+        self.move_budget = move_budget
+
+        self.turn = State.RED
+        self.finished = State.UNFINISHED
+        self.state: list[list[State]] = [
+            [State.UNFINISHED for _ in range(cols)] for _ in range(rows)
+        ]
+        self.context = SearchContext()
+        self.error: SearchError | None = None
+
+    def drop(self, col: int) -> tuple[int, int]:
+        """Drop the current player's piece into a column, and return the cell it lands in"""
+        if self.error is not None:
+            raise self.error
+        if self.finished:
+            raise ValueError(f"Game {self.id} is already finished")
+        if col not in range(self.cols) or self.state[0][col]:
+            raise ValueError(f"Column {col + 1} is not playable in game {self.id}")
+
+        for row in reversed(range(self.rows)):
+            if not self.state[row][col]:
+                break
+
+        self.state[row][col] = self.turn
+        self.finished = is_finished(self.state, (row, col), self.connect)
+        self.turn = -self.turn
+        return row, col
+
+    @property
+    def config(self) -> tuple[int, int, int]:
+        return self.rows, self.cols, self.connect
+
+
+class Scheduler:
+    """
+    Hosts many human vs bot games in one process
+
+    Human moves come in through play() or serve(), and bot searches are sent to a bounded pool of worker processes.
+    Moves for the same game are played one at a time, in the order they came in.
+    Waiting searches are dispatched earliest deadline first, where a search's deadline is the time it was requested
+    plus its game's move budget, so searches that have waited longer and games with tighter budgets go first
+
+    A worker process dying restarts the pool and retries the search. Any other failure of the search
+    fails its game with a SearchError, which is raised to whoever plays in that game
+
+    Queue waits, search times and the depths searches reached are recorded for metrics()
+    """
+
+    def __init__(self, workers: int | None = None, cache_file: str | None = CACHE_FILE):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_file = cache_file
+        self.games: dict[int, Game] = {}
+        self.queue_waits: deque[float] = deque(maxlen=SAMPLES)
+        self.search_times: deque[float] = deque(maxlen=SAMPLES)
+        self.search_depths: deque[int] = deque(maxlen=SAMPLES)
+        self.cut_short: deque[bool] = deque(maxlen=SAMPLES)
+
+        self._ids = count(1)
+        self._order = count()
+        self._queue: asyncio.PriorityQueue | None = None
+        self._executor: ProcessPoolExecutor | None = None
+        self._dispatchers: list[asyncio.Task] = []
+        self._pending: dict[int, asyncio.Future] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    async def __aenter__(self):
+        self._queue = asyncio.PriorityQueue()
+        self._executor = self._start_pool()
+        # one dispatcher per worker, so the pool never queues searches behind our back
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, *_):
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._executor.shutdown(cancel_futures=True)
+
+    def new_game(self, **config) -> Game:
+        """Start a game, taking the same keyword arguments as Game. If the bot goes first, its search is requested"""
+        game = Game(next(self._ids), **config)
+        self.games[game.id] = game
+        self._locks[game.id] = asyncio.Lock()
+        if game.player != State.RED:
+            self._request(game)
+        return game
+
+    def end_game(self, game_id: int):
+        """Stop hosting a game, cancelling its bot move if one is still being searched"""
+        del self.games[game_id]
+        del self._locks[game_id]
+        pending = self._pending.pop(game_id, None)
+        if pending is not None:
+            pending.cancel()
+
+    async def play(self, game_id: int, col: int) -> tuple[int, int] | None:
+        """
+        Play the human's move in a column (0-indexed) of a game, then wait for the bot's reply.
+        A move that comes in while the bot is thinking waits for the bot's reply before being played
+
+        Returns the cell of the bot's move, or None if the human's move finished the game.
+        Raises ValueError for an illegal move or a game that isn't hosted, SearchError if the bot's search failed,
+        and GameEnded if the game was ended before the bot replied
+        """
+        game = self.games.get(game_id)
+        if game is None:
+            raise ValueError(f"There is no game {game_id}")
+
+        async with self._locks[game.id]:
+            if self.games.get(game.id) is not game:
+                raise GameEnded(f"Game {game.id} was ended")
+            if game.error is not None:
+                raise game.error
+
+            # the bot may still be thinking about its first move
+            if game.id in self._pending:
+                await self._wait(game, self._pending[game.id])
+            if game.turn != game.player:
+                raise ValueError(f"It is not the human's turn in game {game.id}")
+
+            game.drop(col)
+            if game.finished:
+                return None
+            return await self._wait(game, self._request(game))
+
+    async def serve(
+        self,
+        moves: AsyncIterable[tuple[int, int]],
+        on_reply: Callable[[Game, tuple[int, int] | None], None] | None = None,
+        on_error: Callable[[Game, SearchError], None] | None = None,
+        on_reject: Callable[[int, int, ValueError], None] | None = None,
+    ):
+        """
+        Play every (game id, column) move from an async source, each game concurrently with the others
+
+        on_reply is called with the game and the bot's reply once it is made,
+        on_error with the game and the SearchError for every move played in a failed game,
+        and on_reject with the game id, the column and the ValueError for every move that could not be played.
+        Moves in games that are ended before the bot replies are dropped
+        """
+        async def handle(game_id: int, col: int):
+            # held on to, as the game may be ended while its move is played
+            game = self.games.get(game_id)
+            try:
+                reply = await self.play(game_id, col)
+            except GameEnded:
+                return
+            except ValueError as e:
+                if on_reject is not None:
+                    on_reject(game_id, col, e)
+                return
+            except SearchError as e:
+                if on_error is not None:
+                    on_error(game, e)
+                return
+            if on_reply is not None:
+                on_reply(game, reply)
+
+        tasks = set()
+        async for game_id, col in moves:
+            task = asyncio.create_task(handle(game_id, col))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    def metrics(self) -> dict:
+        """
+        Returns counts, the 50th, 90th and 99th percentiles of queue waits and search times in seconds,
+        the 1st, 10th and 50th percentiles of the depths searches reached,
+        and the share of searches cut short of their game's depth by its move budget
+        """
+        return {
+            "games": len(self.games),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "searches": len(self.search_times),
+            "queue_wait": _percentiles(self.queue_waits),
+            "search_time": _percentiles(self.search_times),
+            "search_depth": _percentiles(self.search_depths, (1, 10, 50)),
+            "cut_short": sum(self.cut_short) / len(self.cut_short) if self.cut_short else 0.0,
+        }
+
+    async def _wait(self, game: Game, future: asyncio.Future) -> tuple[int, int]:
+        """Wait for the bot's move in a game, without cancelling its search if the one waiting is cancelled"""
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the search itself was cancelled, which only end_game does
+            if future.cancelled():
+                raise GameEnded(f"Game {game.id} was ended") from None
+            raise
+
+    def _request(self, game: Game) -> asyncio.Future:
+        """Queue a search for the bot's move in a game, and return a future for the cell it is played in"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[game.id] = future
+        requested = perf_counter()
+        self._queue.put_nowait((requested + game.move_budget, next(self._order), requested, 0, game, future))
+        return future
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline, order, requested, attempts, game, future = await self._queue.get()
+            if future.done():
+                continue
+
+            started = perf_counter()
+            self.queue_waits.append(started - requested)
+            executor = self._executor
+            try:
+                option, game.context = await loop.run_in_executor(
+                    executor, _think, game.config, game.state, game.depth, game.turn, game.context, game.move_budget
+                )
+            except BrokenProcessPool as e:
+                # a dead worker takes the whole pool down with it, so only the first dispatcher to notice replaces it
+                if executor is self._executor:
+                    executor.shutdown(wait=False)
+                    self._executor = self._start_pool()
+                if attempts < RETRIES:
+                    self._queue.put_nowait((deadline, order, requested, attempts + 1, game, future))
+                else:
+                    self._fail(game, future, e)
+                continue
+            except Exception as e:
+                self._fail(game, future, e)
+                continue
+
+            self.search_times.append(perf_counter() - started)
+            self.search_depths.append(game.context.depth)
+            self.cut_short.append(game.context.depth < game.depth)
+            if self._pending.get(game.id) is future:
+                del self._pending[game.id]
+            if future.done():
+                continue
+
+            future.set_result(game.drop(option["move"][1]))
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.cache_file,))
+
+    def _fail(self, game: Game, future: asyncio.Future, error: Exception):
+        """Fail a game whose bot search failed, and pass the failure on to whoever waits for the bot's move"""
+        game.error = SearchError(f"Bot search failed in game {game.id}: {error!r}")
+        game.error.__cause__ = error
+        if self._pending.get(game.id) is future:
+            del self._pending[game.id]
+        if not future.done():
+            future.set_exception(game.error)
+            # the error stays on the game, so asyncio needn't warn if nobody was waiting for this move
+            future.exception()
+
+
+def _init_worker(cache_file: str | None):
+    global _cache
+    _cache = open_cache(cache_file)
+
+
+def _think(
+    config: tuple[int, int, int],
+    state: list[list[State]],
+    depth: int,
+    turn: State,
+    context: SearchContext,
+    time_limit: float,
+) -> tuple[dict, SearchContext]:
+    """Search for the bot's move in a worker process, returning the context too as the worker only has a copy of it"""
+    _configure(config)
+    return context.search(state, depth, turn, _cache, time_limit), context
+
+
+def _configure(config: tuple[int, int, int]):
+    """
+    Point the engine at a game's configuration, which it reads from the logic module's constants
+
+    Only done in worker processes, which run one search at a time, never in the process hosting the games
+    """
+    logic.ROWS, logic.COLS, logic.CONNECT = config
+
+
+def _percentiles(samples: deque, percents: tuple[int, ...] = (50, 90, 99)) -> dict[str, float]:
+    if not samples:
+        return {}
+    if len(samples) == 1:
+        return {f"p{percent}": samples[0] for percent in percents}
+    cuts = quantiles(samples, n=100, method="inclusive")
+    return {f"p{percent}": cuts[percent - 1] for percent in percents}
+
+
+async def _load_test():
+    """Play SESSIONS games at once against humans that pick random columns, then print the metrics"""
+    rng = Random(0)
+
+    async with Scheduler() as scheduler:
+        games = [
+            scheduler.new_game(depth=SESSION_DEPTH, player=rng.choice((State.RED, State.YELLOW)))
+            for _ in range(SESSIONS)
+        ]
+
+        async def human(game: Game):
+            while not game.finished:
+                col = rng.choice([col for col in range(game.cols) if not game.state[0][col]])
+                await scheduler.play(game.id, col)
+
+        before = perf_counter()
+        await asyncio.gather(*(human(game) for game in games))
+        spent = perf_counter() - before
+
+        print(f"{SESSIONS} games with {scheduler.workers} workers in {spent:.1f}s")
+        for name, value in scheduler.metrics().items():
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_load_test())